@@ -0,0 +1,8 @@
+import pytest
+
+import utils
+
+
+@pytest.fixture(scope='session', autouse=True)
+def logger(tmp_path_factory):
+    utils.set_logger('ImgFaceDetectorTest', path=str(tmp_path_factory.mktemp('logs')), is_test=True)
@@ -1,9 +1,11 @@
-from threading import Lock, Timer
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
 import socket
 
 import cv2
 import face_recognition
 
+import json
 import os
 from datetime import datetime
 
@@ -11,52 +13,27 @@ from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
 import db
+import profiling
 import utils
 import psutil
 
 
-class Periodic:
-    """ A periodic task running in threading.Timers """
-
-    def __init__(self, interval, function, *args, **kwargs):
-        self._lock = Lock()
-        self._timer = None
-        self.function = function
-        self.interval = interval
-        self.args = args
-        self.kwargs = kwargs
-        self._stopped = True
-
-        if kwargs.pop('autostart', True):
-            self.start()
-
-    def start(self, from_run=False):
-        self._lock.acquire()
-        if from_run or self._stopped:
-            self._stopped = False
-            self._timer = Timer(self.interval, self._run)
-            self._timer.start()
-        self._lock.release()
-
-    def _run(self):
-        self.start(from_run=True)
-        self.function(*self.args, **self.kwargs)
-
-    def stop(self):
-        self._lock.acquire()
-        self._stopped = True
-        self._timer.cancel()
-        self._lock.release()
-
-
 class Watcher(FileSystemEventHandler):
-    def __init__(self, path, dbsession, output, recursive=True, auto_start=True, ):
+    def __init__(self, path, dbsession, output, recursive=True, auto_start=True, profiler=None, pool=None,
+                 detectors=None, ):
         super().__init__()
         self.path = path
         self.__recursive = recursive
         self.__observer = Observer()
+        self.__db_lock = Lock()
+        self.__closed = False
+        self.__events_lock = Lock()
+        self.__events = {}
         self.dbsession = dbsession
         self.output = output
+        self.profiler = profiler or profiling.Profiler(output_path=os.path.join(output, 'profiles'))
+        self.pool = pool
+        self.detectors = detectors
         self.__auto_start = auto_start
 
         if auto_start:
@@ -84,9 +61,61 @@ class Watcher(FileSystemEventHandler):
         self.__observer.schedule(self, self.path, recursive=self.__recursive)
         self.__observer.start()
 
-    def stop(self):
+    def stop(self, timeout=None):
         self.__observer.stop()
-        self.__observer.join()
+        if self.pool is not None:
+            # Release the observer thread if it is blocked on paused intake, then drain the queue.
+            # With timeout=None the whole remaining backlog is processed before returning.
+            self.pool.resume()
+            self.__observer.join()
+            self.pool.stop(timeout=timeout)
+        else:
+            self.__observer.join()
+
+    def commit(self):
+        """
+        Final commit of the shared session. Workers still running after a shutdown timeout are not allowed
+        to touch the session afterwards, their observations are dropped.
+        """
+        with self.__db_lock:
+            self.__closed = True
+            return db.commit_observations(self.dbsession)
+
+    def submit_event(self, event, event_type: str):
+        if self.pool is None:
+            self.process_event(event, event_type)
+            return
+
+        # Watchdog sends created and then one or more modified events for the same file. Only one event
+        # per path is queued or running at a time: repeats of a queued event are merged into it, and an
+        # event arriving while the path is being processed schedules a single re-run afterwards.
+        path = os.path.abspath(event.src_path)
+        with self.__events_lock:
+            state = self.__events.get(path)
+            if state == 'running':
+                self.__events[path] = 'rerun'
+            if state is not None:
+                utils.INFO(f"[{event_type}] event for '{path}' merged into the pending one.")
+                return
+            self.__events[path] = 'queued'
+        self.pool.submit(self.__run_event, event, event_type)
+
+    def __run_event(self, event, event_type: str):
+        path = os.path.abspath(event.src_path)
+        with self.__events_lock:
+            self.__events[path] = 'running'
+        try:
+            self.process_event(event, event_type)
+        finally:
+            with self.__events_lock:
+                rerun = self.__events.get(path) == 'rerun'
+                if rerun:
+                    self.__events[path] = 'queued'
+                else:
+                    self.__events.pop(path, None)
+            if rerun:
+                # Only the observer is throttled by paused intake, a worker must never block on it.
+                self.pool.submit(self.__run_event, event, 'modify', block=False)
 
     def on_created(self, event):
         if event.is_directory:
@@ -94,7 +123,7 @@ class Watcher(FileSystemEventHandler):
         else:
             utils.INFO(f"[File created] Path: {event.src_path}")
 
-        self.process_event(event, 'create')
+        self.submit_event(event, 'create')
 
     def on_modified(self, event):
         if event.is_directory:
@@ -102,7 +131,7 @@ class Watcher(FileSystemEventHandler):
         else:
             utils.INFO(f"[File modified] Path: {event.src_path}")
 
-        self.process_event(event, 'modify')
+        self.submit_event(event, 'modify')
 
     def on_deleted(self, event):
         if event.is_directory:
@@ -131,53 +160,135 @@ class Watcher(FileSystemEventHandler):
 
         system = f"Available CPUs:{os.cpu_count()},Available Memory:{psutil.virtual_memory().available / (1024.0 ** 2)}MB"
 
-        prediction_start_time = datetime.now()
-        if utils.is_image(photo_path):
-            predictions_path, prediction_status, contain_faces = predict(
-                input=photo_path,
-                output=self.output
-            )
-        else:
-            utils.WARNING('The provided file is not an image file.')
-            predictions_path = None
-            prediction_status = None
-            contain_faces = None
-        prediction_end_time = datetime.now()
-
-        data = {
-            "event_type": event_type,
-            "tbl_dt": tbl_dt,
-            "photo_path": photo_path,
-            "node": node,
-            "pid": pid,
-            "puser": puser,
-            "system": system,
-            "prediction_end_time": prediction_end_time,
-            "prediction_start_time": prediction_start_time,
-            "predictions_path": predictions_path,
-            "prediction_status": prediction_status,
-            "contain_faces": contain_faces,
-        }
-        utils.INFO(f'Values: {data} are written to DB.')
-        # Get the host IP address
-        db.create_and_insert_observation(
-            session=self.dbsession,
-            data=data
-        )
-        utils.INFO('New Observation Insertion to DB done successfully')
-
-
-def predict(input, output):
+        profile = self.profiler.begin(photo_path)
+        try:
+            prediction_start_time = datetime.now()
+            if utils.is_image(photo_path):
+                predictions_path, prediction_status, contain_faces, pages = predict(
+                    input=photo_path,
+                    output=self.output,
+                    profile=profile,
+                    detectors=self.detectors,
+                )
+            else:
+                utils.WARNING('The provided file is not an image file.')
+                predictions_path = None
+                prediction_status = None
+                contain_faces = None
+                pages = None
+            prediction_end_time = datetime.now()
+
+            data = {
+                "event_type": event_type,
+                "tbl_dt": tbl_dt,
+                "photo_path": photo_path,
+                "node": node,
+                "pid": pid,
+                "puser": puser,
+                "system": system,
+                "prediction_end_time": prediction_end_time,
+                "prediction_start_time": prediction_start_time,
+                "predictions_path": predictions_path,
+                "prediction_status": prediction_status,
+                "contain_faces": contain_faces,
+                "frames": len(pages) if pages is not None else None,
+                "frame_results": json.dumps(pages) if pages is not None else None,
+            }
+            utils.INFO(f'Values: {data} are written to DB.')
+            # Get the host IP address
+            # The session is shared between the detection workers.
+            with profile.stage('db'), self.__db_lock:
+                if self.__closed:
+                    utils.WARNING(f"Session already committed for shutdown, observation for '{photo_path}' dropped.")
+                    return
+                db.create_and_insert_observation(
+                    session=self.dbsession,
+                    data=data
+                )
+            utils.INFO('New Observation Insertion to DB done successfully')
+        except Exception as e:
+            profile.error = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            # Failed events are often the slow ones, always dump the capture and check the threshold.
+            self.profiler.finish(profile)
+
+
+# face_recognition shares one module-level dlib detector, which is not safe for concurrent use. Detection in
+# this process is serialised; CPU scaling comes from the detector processes, each holding its own detector.
+_DETECTOR_LOCK = Lock()
+
+
+def create_detector_pool(processes: int):
+    if not processes:
+        return None
+    utils.INFO(f'Starting up to {processes} face detector processes.')
+    return ProcessPoolExecutor(max_workers=processes)
+
+
+def detect_faces(image, detectors=None):
+    if detectors is not None:
+        return detectors.submit(face_recognition.face_locations, image).result()
+    with _DETECTOR_LOCK:
+        return face_recognition.face_locations(image)
+
+
+def predict(input, output, profile=None, detectors=None):
+    profile = profile or profiling.EventProfile(input)
     output_dir = os.path.join(output, os.path.basename(os.path.splitext(input)[-2]))
 
-    if not os.path.exists(output_dir):
-        os.mkdir(output_dir)
-
-    image = face_recognition.load_image_file(input)
-    face_locations = face_recognition.face_locations(image)
-    utils.INFO(f"Face locations details: {face_locations}")
-    if not face_locations:
-        return output_dir, 'fail', False
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Multi-page/animated files get one sub directory per page, single frame images keep the flat layout.
+    pages = []
+    frames = utils.iter_frames(input)
+    while True:
+        with profile.stage('load'):
+            frame = next(frames, None)
+        if frame is None:
+            break
+        index, image, duplicate_of, multi_frame = frame
+        del frame
+
+        if duplicate_of is not None:
+            utils.INFO(f"Page {index} is identical to page {duplicate_of}, skipping detection.")
+            pages.append({**pages[-1], "page": index, "duplicate_of": duplicate_of})
+            continue
+
+        if profile.dimensions is None:
+            profile.dimensions = list(image.shape)
+
+        with profile.stage('detect'):
+            face_locations = detect_faces(image, detectors)
+        utils.INFO(f"Page {index} face locations details: {face_locations}")
+
+        predictions_file = None
+        if face_locations:
+            page_dir = os.path.join(output_dir, f'page_{index:04d}') if multi_frame else output_dir
+            with profile.stage('write'):
+                predictions_file = _write_faces(image, face_locations, page_dir, os.path.splitext(input)[-1])
+
+        pages.append({
+            "page": index,
+            "shape": list(image.shape),
+            "faces": len(face_locations),
+            "predictions_path": predictions_file,
+            "duplicate_of": None,
+        })
+        del image
+
+    profile.frames = len(pages)
+    profile.pages = pages
+    profile.faces = sum(page['faces'] for page in pages)
+    if not profile.faces:
+        return output_dir, 'fail', False, pages
+    if len(pages) == 1:
+        return pages[0]['predictions_path'], 'success', True, pages
+    return output_dir, 'success', True, pages
+
+
+def _write_faces(image, face_locations, output_dir, extension):
+    os.makedirs(output_dir, exist_ok=True)
 
     predictions_file = os.path.join(output_dir, 'preds.txt')
     with open(predictions_file, 'tw') as file:
@@ -189,8 +300,8 @@ def predict(input, output):
             file.write(' '.join(list(map(str, [i, top, right, bottom, left]))))
 
             face_image = image[top:bottom, left:right]
-            cv2.imwrite(os.path.join(output_dir, f"{i}.{os.path.splitext(input)[-1]}"), face_image)
-    return predictions_file, 'success', True
+            cv2.imwrite(os.path.join(output_dir, f"{i}.{extension}"), face_image)
+    return predictions_file
 
 # if __name__ == "__main__":
 #     watcher = Watcher(path=path, logger=logger, dbsession=dbsession, recursive=recursive, auto_start=auto_start, )
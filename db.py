@@ -9,6 +9,7 @@ from sshtunnel import SSHTunnelForwarder
 from sqlalchemy.sql import func
 import pandas as pd
 from sqlalchemy.schema import CreateSchema
+from sqlalchemy import text
 
 import utils
 
@@ -198,6 +199,23 @@ class Observation(Base, Model, metaclass=MetaModelBase):
     prediction_status = Column(String)
     event_type = Column(String, nullable=False)
     contain_faces = Column(Boolean)
+    frames = Column(Integer)
+    frame_results = Column(String)
+
+
+# Columns added after the table was first deployed. create_all never alters an existing table,
+# so these run (idempotently) on every session setup.
+OBSERVATION_MIGRATIONS = (
+    'ALTER TABLE audit.image_observer ADD COLUMN IF NOT EXISTS frames INTEGER',
+    'ALTER TABLE audit.image_observer ADD COLUMN IF NOT EXISTS frame_results VARCHAR',
+)
+
+
+def migrate_observations(conn):
+    for statement in OBSERVATION_MIGRATIONS:
+        utils.INFO(f'Applying migration: {statement}')
+        conn.execute(text(statement))
+    conn.commit()
 
 
 def create_and_insert_observation(session, data: dict, commit=True):
@@ -268,6 +286,8 @@ def create_database_session(config: dict, ):
         else:
             utils.INFO("Database and Tables already exist. Establishing connection with DB construction.")
 
+        migrate_observations(conn)
+
         conn.close()
         del conn
 
@@ -7,7 +7,9 @@ import time
 
 import controller
 import db
+import profiling
 import utils
+import workers
 
 
 # Press Shift+F10 to execute it or replace it with your code.
@@ -27,13 +29,28 @@ def main(args):
     if not os.path.exists(config['run']['output_path']):
         os.mkdir(config['run']['output_path'])
 
-    watcher = controller.Watcher(
-        auto_start=True,
-        recursive=config['run']['Recursive'],
-        dbsession=dbsession,
-        path=config['run']['input_path'],
-        output=config['run']['output_path']
-    )
+    profiler = profiling.create_profiler(config.get('profiling', {}))
+    concurrency = config.get('concurrency', {})
+    pool, autoscaler = workers.create_worker_pool(concurrency)
+    detectors = controller.create_detector_pool(concurrency.get('DETECTOR_PROCESSES', pool.max_workers))
+
+    try:
+        watcher = controller.Watcher(
+            auto_start=True,
+            recursive=config['run']['Recursive'],
+            dbsession=dbsession,
+            path=config['run']['input_path'],
+            output=config['run']['output_path'],
+            profiler=profiler,
+            pool=pool,
+            detectors=detectors,
+        )
+    except Exception:
+        autoscaler.stop()
+        pool.stop()
+        if detectors is not None:
+            detectors.shutdown(cancel_futures=True)
+        raise
 
     try:
         while True:
@@ -43,8 +60,11 @@ def main(args):
     except Exception as e:
         utils.ERROR(f'Service shutdown with unknown error: {e}')
     finally:
-        db.commit_observations(dbsession)
-        watcher.stop()
+        autoscaler.stop()
+        watcher.stop(timeout=concurrency.get('SHUTDOWN_TIMEOUT'))
+        watcher.commit()
+        if detectors is not None:
+            detectors.shutdown(wait=False, cancel_futures=True)
         sys.exit(0)
 
 
@@ -0,0 +1,182 @@
+import cProfile
+import json
+import os
+import shutil
+import signal
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from threading import Lock
+
+import utils
+
+
+class EventProfile:
+    """ Stage timings (and optional cProfile captures) collected while processing a single event """
+
+    def __init__(self, photo_path, capture=False):
+        self.photo_path = photo_path
+        self.capture = capture
+        # capture may be switched off mid-event, the slot held in the Profiler is released by finish.
+        self.holds_capture = capture
+        self.timings = {}
+        self.profiles = {}
+        self.dimensions = None
+        self.frames = None
+        self.pages = None
+        self.faces = None
+        self.error = None
+        self.__start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        profile = None
+        if self.capture:
+            profile = self.profiles.get(name) or cProfile.Profile()
+            try:
+                profile.enable()
+                self.profiles[name] = profile
+            except ValueError as e:
+                # Python 3.12+ allows a single active profiler per process, fall back to timing only.
+                utils.WARNING(f"cProfile capture unavailable for '{self.photo_path}': {e}")
+                self.capture = False
+                profile = None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000.0
+            if profile is not None:
+                profile.disable()
+            # Stages may be entered more than once per event, keep the total.
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.__start) * 1000.0
+
+
+class Profiler:
+    """
+    Cheap per-stage timing for every event, plus on-demand cProfile capture for the next N events
+    and a log of images whose processing exceeded a latency threshold.
+    """
+
+    def __init__(self, output_path, events=10, enabled=False, slow_threshold_ms=None,
+                 slow_path=None, copy_slow=False):
+        self._lock = Lock()
+        self.output_path = output_path
+        self.events = events
+        self.slow_threshold_ms = slow_threshold_ms
+        self.slow_path = slow_path or output_path
+        self.copy_slow = copy_slow
+        self.__remaining = 0
+        self.__capturing = False
+
+        if enabled:
+            self.arm()
+
+    def arm(self, events=None):
+        with self._lock:
+            self.__remaining = self.events if events is None else events
+        utils.INFO(f'Profiling armed for the next {self.__remaining} events.')
+
+    def disarm(self):
+        with self._lock:
+            self.__remaining = 0
+        utils.INFO('Profiling disarmed.')
+
+    def toggle(self, *args):
+        """ Signal handler: arm the profiler, or disarm it if a capture is still in progress """
+        if self.__remaining:
+            self.disarm()
+        else:
+            self.arm()
+
+    def begin(self, photo_path):
+        # Only one event is captured at a time: concurrent cProfile sessions fail on Python 3.12+ and
+        # would mix work from other detection workers. On 3.12+ a capture still sees every thread, use a
+        # single worker (MAX_WORKERS=1) when clean per-event stats are needed.
+        with self._lock:
+            capture = self.__remaining > 0 and not self.__capturing
+            if capture:
+                self.__remaining -= 1
+                self.__capturing = True
+        return EventProfile(photo_path, capture=capture)
+
+    def finish(self, profile: EventProfile):
+        if profile.holds_capture:
+            with self._lock:
+                self.__capturing = False
+        total_ms = profile.elapsed_ms()
+        utils.INFO(f"Stage timings for '{profile.photo_path}': {profile.timings} Total: {total_ms:.1f}ms"
+                   + (f" Error: {profile.error}" if profile.error else ''))
+
+        if profile.profiles:
+            self.__dump_stats(profile)
+
+        if self.slow_threshold_ms is not None and total_ms >= self.slow_threshold_ms:
+            self.__log_slow(profile, total_ms)
+
+    def __dump_stats(self, profile: EventProfile):
+        try:
+            os.makedirs(self.output_path, exist_ok=True)
+            stem = f"{datetime.now():%Y%m%d_%H%M%S_%f}_{os.path.basename(os.path.splitext(profile.photo_path)[-2])}"
+            for stage, stats in profile.profiles.items():
+                file = os.path.join(self.output_path, f'{stem}.{stage}.prof')
+                stats.dump_stats(file)
+                utils.INFO(f'Profile stats for stage [{stage}] written to: {file}')
+        except Exception as e:
+            utils.ERROR(f"Failed to dump profile stats for '{profile.photo_path}': {e}")
+
+    def __log_slow(self, profile: EventProfile, total_ms):
+        utils.WARNING(f"Slow image '{profile.photo_path}' took {total_ms:.1f}ms "
+                      f"(threshold {self.slow_threshold_ms}ms).")
+        record = {
+            "time": datetime.now().isoformat(),
+            "photo_path": profile.photo_path,
+            "dimensions": profile.dimensions,
+            "frames": profile.frames,
+            "pages": profile.pages,
+            "faces": profile.faces,
+            "timings_ms": profile.timings,
+            "total_ms": total_ms,
+            "error": profile.error,
+            "copy_path": None,
+        }
+        try:
+            os.makedirs(self.slow_path, exist_ok=True)
+            if self.copy_slow and os.path.isfile(profile.photo_path):
+                copy_path = os.path.join(
+                    self.slow_path, f"{datetime.now():%Y%m%d_%H%M%S_%f}_{os.path.basename(profile.photo_path)}"
+                )
+                shutil.copy2(profile.photo_path, copy_path)
+                record['copy_path'] = copy_path
+
+            with self._lock, open(os.path.join(self.slow_path, 'slow_images.jsonl'), 'ta') as file:
+                file.write(json.dumps(record) + '\n')
+        except Exception as e:
+            utils.ERROR(f"Failed to record slow image '{profile.photo_path}': {e}")
+
+
+def install_signal_handler(profiler: Profiler):
+    # SIGUSR1 is not available on Windows, fall back to the config flag there.
+    if not hasattr(signal, 'SIGUSR1'):
+        utils.WARNING('SIGUSR1 is not supported on this platform. Use the profiling config flag instead.')
+        return False
+    signal.signal(signal.SIGUSR1, profiler.toggle)
+    utils.INFO(f'Send SIGUSR1 to process {os.getpid()} to toggle profiling.')
+    return True
+
+
+def create_profiler(config: dict, ):
+    profiler = Profiler(
+        output_path=config.get('OUTPUT_PATH', 'profiles'),
+        events=config.get('EVENTS', 10),
+        enabled=config.get('ENABLED', False),
+        slow_threshold_ms=config.get('SLOW_THRESHOLD_MS'),
+        slow_path=config.get('SLOW_PATH'),
+        copy_slow=config.get('COPY_SLOW', False),
+    )
+    if config.get('USE_SIGNAL', True):
+        install_signal_handler(profiler)
+    return profiler
@@ -0,0 +1,155 @@
+import time
+from threading import Event, Thread
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('face_recognition')
+pytest.importorskip('cv2')
+
+import controller  # noqa: E402
+import workers  # noqa: E402
+
+
+def test_events_for_the_same_path_are_serialised(tmp_path, monkeypatch):
+    pool = workers.WorkerPool(min_workers=4, max_workers=4)
+    watcher = controller.Watcher(
+        path=str(tmp_path), dbsession=None, output=str(tmp_path), auto_start=False, pool=pool,
+    )
+    release = Event()
+    running, calls = [], []
+
+    def process_event(event, event_type):
+        running.append(event.src_path)
+        assert running.count(event.src_path) == 1, 'the same path is processed twice at once'
+        calls.append(event_type)
+        release.wait(5)
+        running.remove(event.src_path)
+
+    monkeypatch.setattr(watcher, 'process_event', process_event)
+    event = SimpleNamespace(src_path=str(tmp_path / 'a.jpg'), is_directory=False)
+
+    watcher.submit_event(event, 'create')
+    time.sleep(0.1)
+    # Arrive while the create is running: merged into a single re-run.
+    watcher.submit_event(event, 'modify')
+    watcher.submit_event(event, 'modify')
+    release.set()
+    pool.stop()
+
+    assert calls == ['create', 'modify']
+
+
+def test_rerun_does_not_block_on_paused_intake(tmp_path, monkeypatch):
+    pool = workers.WorkerPool(min_workers=1, max_workers=1)
+    watcher = controller.Watcher(
+        path=str(tmp_path), dbsession=None, output=str(tmp_path), auto_start=False, pool=pool,
+    )
+    release = Event()
+    calls = []
+
+    def process_event(event, event_type):
+        calls.append(event_type)
+        release.wait(5)
+
+    monkeypatch.setattr(watcher, 'process_event', process_event)
+    event = SimpleNamespace(src_path=str(tmp_path / 'a.jpg'), is_directory=False)
+
+    watcher.submit_event(event, 'create')
+    time.sleep(0.1)
+    watcher.submit_event(event, 'modify')
+    pool.pause()
+    release.set()
+
+    # The single worker queues the re-run and picks it up while intake is still paused.
+    deadline = time.perf_counter() + 2
+    while calls != ['create', 'modify'] and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    assert calls == ['create', 'modify']
+    pool.stop()
+
+
+def test_in_process_detection_is_serialised(monkeypatch):
+    active, overlaps = [], []
+
+    def face_locations(image):
+        active.append(image)
+        overlaps.append(len(active))
+        time.sleep(0.02)
+        active.remove(image)
+        return []
+
+    monkeypatch.setattr(controller.face_recognition, 'face_locations', face_locations)
+    threads = [Thread(target=controller.detect_faces, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert overlaps == [1, 1, 1, 1]
+
+
+def test_detection_in_worker_processes():
+    import numpy
+
+    detectors = controller.create_detector_pool(1)
+    try:
+        assert controller.detect_faces(numpy.zeros((20, 20, 3), dtype='uint8'), detectors) == []
+    finally:
+        detectors.shutdown()
+    assert controller.create_detector_pool(0) is None
+
+
+def test_predict_records_every_page(tmp_path, monkeypatch):
+    from PIL import Image
+
+    red, blue = Image.new('RGB', (20, 20), 'red'), Image.new('RGB', (20, 20), 'blue')
+    path = str(tmp_path / 'scan.tiff')
+    red.save(path, save_all=True, append_images=[red.copy(), blue])
+    output = tmp_path / 'output'
+    output.mkdir()
+    monkeypatch.setattr(controller.face_recognition, 'face_locations', lambda image: [(2, 10, 8, 4)])
+
+    predictions_path, status, contain_faces, pages = controller.predict(path, str(output))
+
+    assert (status, contain_faces) == ('success', True)
+    assert predictions_path == str(output / 'scan')
+    assert [page['page'] for page in pages] == [0, 1, 2]
+    assert [page['duplicate_of'] for page in pages] == [None, 0, None]
+    assert all(page['faces'] == 1 and page['shape'] == [20, 20, 3] for page in pages)
+    assert pages[1]['predictions_path'] == pages[0]['predictions_path']
+    assert (output / 'scan' / 'page_0000' / 'preds.txt').exists()
+    assert (output / 'scan' / 'page_0002' / 'preds.txt').exists()
+    assert not (output / 'scan' / 'page_0001').exists()
+
+
+def test_predict_single_frame_keeps_flat_layout(tmp_path, monkeypatch):
+    from PIL import Image
+
+    path = str(tmp_path / 'photo.png')
+    Image.new('RGB', (20, 20), 'red').save(path)
+    output = tmp_path / 'output'
+    output.mkdir()
+    monkeypatch.setattr(controller.face_recognition, 'face_locations', lambda image: [])
+
+    predictions_path, status, contain_faces, pages = controller.predict(path, str(output))
+
+    assert (predictions_path, status, contain_faces) == (str(output / 'photo'), 'fail', False)
+    assert pages == [{
+        "page": 0, "shape": [20, 20, 3], "faces": 0, "predictions_path": None, "duplicate_of": None,
+    }]
+
+
+def test_no_inserts_after_final_commit(tmp_path, monkeypatch):
+    watcher = controller.Watcher(path=str(tmp_path), dbsession=None, output=str(tmp_path), auto_start=False)
+    inserted = []
+    monkeypatch.setattr(controller.os, 'getlogin', lambda: 'tester')
+    monkeypatch.setattr(controller.db, 'commit_observations', lambda session: True)
+    monkeypatch.setattr(controller.db, 'create_and_insert_observation', lambda session, data: inserted.append(data))
+    event = SimpleNamespace(src_path=str(tmp_path / 'notes.txt'), is_directory=False)
+
+    watcher.process_event(event, 'create')
+    assert watcher.commit()
+    watcher.process_event(event, 'modify')
+
+    assert [data['event_type'] for data in inserted] == ['create']
@@ -0,0 +1,33 @@
+import os
+import time
+
+import profiling
+
+
+def test_one_capture_at_a_time(tmp_path):
+    profiler = profiling.Profiler(output_path=str(tmp_path), events=2, enabled=True)
+
+    first = profiler.begin('a.jpg')
+    second = profiler.begin('b.jpg')
+    assert first.capture
+    assert not second.capture
+
+    with first.stage('detect'):
+        time.sleep(0.01)
+    profiler.finish(first)
+    profiler.finish(second)
+    assert [name for name in os.listdir(tmp_path) if name.endswith('.detect.prof')]
+
+    # The slot is released and the armed count was only consumed by the captured event.
+    assert profiler.begin('c.jpg').capture
+    assert not profiler.begin('d.jpg').capture
+
+
+def test_failed_slow_event_is_logged(tmp_path):
+    profiler = profiling.Profiler(output_path=str(tmp_path), slow_threshold_ms=0)
+    profile = profiler.begin('a.jpg')
+    profile.error = 'ValueError: broken'
+    profiler.finish(profile)
+
+    with open(os.path.join(tmp_path, 'slow_images.jsonl')) as file:
+        assert '"error": "ValueError: broken"' in file.read()
@@ -0,0 +1,65 @@
+from PIL import Image
+
+import utils
+
+
+def solid(color, mode='RGB', size=(8, 6)):
+    return Image.new(mode, size, color)
+
+
+def save_frames(path, frames, **kwargs):
+    frames[0].save(path, save_all=True, append_images=frames[1:], **kwargs)
+    return str(path)
+
+
+def test_iter_frames_marks_consecutive_duplicates(tmp_path):
+    red, blue = solid('red'), solid('blue')
+    path = save_frames(tmp_path / 'scan.tiff', [red, red.copy(), red.copy(), blue, red.copy()])
+
+    frames = [(index, duplicate_of, multi_frame) for index, _, duplicate_of, multi_frame in utils.iter_frames(path)]
+
+    # Only consecutive repeats are duplicates, page 4 follows a different page.
+    assert frames == [(0, None, True), (1, 0, True), (2, 0, True), (3, None, True), (4, None, True)]
+
+
+def test_iter_frames_duplicate_has_no_array(tmp_path):
+    path = save_frames(tmp_path / 'scan.tiff', [solid('red'), solid('red')])
+    arrays = [array for _, array, _, _ in utils.iter_frames(path)]
+    assert arrays[0] is not None
+    assert arrays[1] is None
+
+
+def test_iter_frames_dedupe_disabled(tmp_path):
+    path = save_frames(tmp_path / 'scan.tiff', [solid('red'), solid('red')])
+    assert [duplicate_of for _, _, duplicate_of, _ in utils.iter_frames(path, dedupe=False)] == [None, None]
+
+
+def test_iter_frames_single_frame(tmp_path):
+    path = str(tmp_path / 'photo.png')
+    solid('green').save(path)
+
+    frames = list(utils.iter_frames(path))
+
+    assert len(frames) == 1
+    index, array, duplicate_of, multi_frame = frames[0]
+    assert (index, duplicate_of, multi_frame) == (0, None, False)
+    assert array.shape == (6, 8, 3)
+
+
+def test_iter_frames_animated_gif(tmp_path):
+    path = save_frames(tmp_path / 'anim.gif', [solid('red'), solid('blue'), solid('green')], duration=100)
+
+    frames = list(utils.iter_frames(path))
+
+    assert [index for index, _, _, _ in frames] == [0, 1, 2]
+    assert all(multi_frame for _, _, _, multi_frame in frames)
+    assert all(duplicate_of is None for _, _, duplicate_of, _ in frames)
+
+
+def test_iter_frames_converts_to_writable_rgb(tmp_path):
+    path = save_frames(tmp_path / 'scan.tiff', [solid(128, mode='L'), solid(1, mode='1')])
+
+    for _, array, _, _ in utils.iter_frames(path):
+        assert array.shape == (6, 8, 3)
+        assert str(array.dtype) == 'uint8'
+        assert array.flags.writeable
@@ -0,0 +1,166 @@
+import time
+from threading import Event, Thread
+from types import SimpleNamespace
+
+import pytest
+
+import workers
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+@pytest.fixture
+def system(monkeypatch):
+    """ Fixed psutil readings, tweak the returned namespace to simulate load """
+    state = SimpleNamespace(cpu_percent=10.0, memory_percent=50.0)
+    monkeypatch.setattr(workers.psutil, 'cpu_percent', lambda interval=None: state.cpu_percent)
+    monkeypatch.setattr(
+        workers.psutil, 'virtual_memory',
+        lambda: SimpleNamespace(available=state.memory_percent, total=100.0),
+    )
+    return state
+
+
+def test_periodic_stop_without_start():
+    periodic = workers.Periodic(1, lambda: None, autostart=False)
+    periodic.stop()
+
+
+def test_periodic_timer_does_not_block_exit():
+    periodic = workers.Periodic(10, lambda: None)
+    assert periodic._timer.daemon
+    periodic.stop()
+
+
+def test_pool_resize_within_bounds():
+    pool = workers.WorkerPool(min_workers=1, max_workers=3)
+    assert pool.size == 1
+    assert pool.resize(10) == 3
+    assert pool.size == 3
+    assert pool.resize(0) == 1
+    assert pool.size == 1
+    pool.stop()
+    assert pool.size == 0
+
+
+def test_pool_retired_workers_exit():
+    pool = workers.WorkerPool(min_workers=1, max_workers=3)
+    pool.resize(3)
+    pool.resize(1)
+    # Retiring threads leave within one queue poll.
+    assert wait_for(lambda: pool.size == 1)
+    done = []
+    pool.submit(done.append, 1)
+    assert wait_for(lambda: done == [1])
+    pool.stop()
+
+
+def test_pool_pause_blocks_submit():
+    pool = workers.WorkerPool()
+    pool.pause()
+    assert pool.paused
+
+    submitted = Event()
+    producer = Thread(target=lambda: (pool.submit(lambda: None), submitted.set()), daemon=True)
+    producer.start()
+    assert not submitted.wait(0.2)
+
+    pool.resume()
+    assert submitted.wait(1)
+    pool.stop()
+
+
+def test_pool_non_blocking_submit_while_paused():
+    pool = workers.WorkerPool()
+    done = []
+    pool.pause()
+    pool.submit(done.append, 1, block=False)
+    assert wait_for(lambda: done == [1])
+    pool.resume()
+    pool.stop()
+
+
+def test_pool_stop_drains_backlog():
+    pool = workers.WorkerPool()
+    done = []
+    for i in range(5):
+        pool.submit(lambda i=i: (time.sleep(0.01), done.append(i)))
+    pool.stop()
+    assert done == [0, 1, 2, 3, 4]
+
+
+def test_pool_stop_timeout_drops_backlog():
+    pool = workers.WorkerPool()
+    release = Event()
+    done = []
+    pool.submit(release.wait, 5)
+    for i in range(3):
+        pool.submit(done.append, i)
+
+    start = time.perf_counter()
+    pool.stop(timeout=0.2)
+    assert time.perf_counter() - start < 1
+    assert pool.backlog == 0
+    release.set()
+    assert done == []
+
+
+def test_autoscaler_grows_while_workers_are_stuck(system):
+    pool = workers.WorkerPool(min_workers=1, max_workers=2)
+    autoscaler = workers.Autoscaler(pool, target_latency_ms=50, auto_start=False)
+    release = Event()
+    pool.submit(release.wait, 5)
+    assert wait_for(lambda: pool.backlog == 0)
+    for _ in range(4):
+        pool.submit(release.wait, 5)
+
+    # The only worker is busy, nothing is dequeued, the queue head keeps ageing.
+    time.sleep(0.1)
+    autoscaler.tick()
+
+    assert autoscaler.metrics['oldest_wait_ms'] >= 50
+    assert autoscaler.metrics['actions'] == ['grow']
+    assert pool.size == 2
+    release.set()
+    autoscaler.stop()
+    pool.stop()
+
+
+def test_autoscaler_shrinks_when_idle(system):
+    pool = workers.WorkerPool(min_workers=1, max_workers=3)
+    pool.resize(3)
+    autoscaler = workers.Autoscaler(pool, target_latency_ms=50, auto_start=False)
+    autoscaler.tick()
+    assert autoscaler.metrics['actions'] == ['shrink']
+    assert pool.size == 2
+    pool.stop()
+
+
+def test_autoscaler_pauses_on_low_memory_and_resumes(system):
+    pool = workers.WorkerPool(min_workers=1, max_workers=3)
+    pool.resize(2)
+    autoscaler = workers.Autoscaler(pool, min_memory_percent=10, resume_memory_percent=20, auto_start=False)
+
+    system.memory_percent = 5.0
+    autoscaler.tick()
+    assert pool.paused
+    assert autoscaler.metrics['actions'] == ['pause', 'shrink']
+    assert pool.size == 1
+
+    # Between the two thresholds intake stays paused.
+    system.memory_percent = 15.0
+    autoscaler.tick()
+    assert pool.paused
+
+    system.memory_percent = 25.0
+    autoscaler.tick()
+    assert not pool.paused
+    assert autoscaler.metrics['resume_total'] == 1
+    pool.stop()
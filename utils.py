@@ -1,9 +1,13 @@
 import glob
+import hashlib
 import json, logging, os
 import shutil
 import subprocess
 from datetime import datetime
 
+import numpy
+from PIL import Image, ImageSequence
+
 
 def get_days_between_dates(date1, date2):
     # Convert the date strings to datetime objects
@@ -53,6 +57,31 @@ def is_image(file_path):
         return False
 
 
+def iter_frames(file_path, mode='RGB', dedupe=True):
+    """
+    Yield (index, array, duplicate_of, multi_frame) for every frame/page of an image, decoding one frame
+    at a time. When a frame of a multi-frame image is identical to the previous one, array is None and
+    duplicate_of is the index of the frame it repeats.
+    """
+    with Image.open(file_path) as img:
+        # is_animated only reads up to the second frame boundary, unlike n_frames which walks the whole file.
+        multi_frame = getattr(img, 'is_animated', False)
+        previous_digest, previous_index = None, None
+        for index, frame in enumerate(ImageSequence.Iterator(img)):
+            # Writable copy, like face_recognition.load_image_file, skipping convert when the mode matches.
+            array = numpy.array(frame.convert(mode) if mode and frame.mode != mode else frame)
+            if dedupe and multi_frame:
+                digest = hashlib.blake2b(array, digest_size=16).digest()
+                if digest == previous_digest:
+                    del array
+                    yield index, None, previous_index, multi_frame
+                    continue
+                previous_digest, previous_index = digest, index
+            yield index, array, None, multi_frame
+            # Drop the reference before the next page is decoded so only one page is held at a time.
+            del array
+
+
 def run_terminal_command(command):
     try:
         # Run the command and capture the output
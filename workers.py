@@ -0,0 +1,291 @@
+from queue import Queue, Empty
+from threading import Event, Lock, Thread, Timer, current_thread
+from datetime import datetime
+import json
+import os
+import time
+
+import psutil
+
+import utils
+
+
+class Periodic:
+    """ A periodic task running in threading.Timers """
+
+    def __init__(self, interval, function, *args, **kwargs):
+        self._lock = Lock()
+        self._timer = None
+        self.function = function
+        self.interval = interval
+        self.args = args
+        self.kwargs = kwargs
+        self._stopped = True
+
+        if kwargs.pop('autostart', True):
+            self.start()
+
+    def start(self, from_run=False):
+        self._lock.acquire()
+        if from_run or self._stopped:
+            self._stopped = False
+            self._timer = Timer(self.interval, self._run)
+            # A forgotten stop() must not keep the interpreter alive.
+            self._timer.daemon = True
+            self._timer.start()
+        self._lock.release()
+
+    def _run(self):
+        self.start(from_run=True)
+        self.function(*self.args, **self.kwargs)
+
+    def stop(self):
+        self._lock.acquire()
+        self._stopped = True
+        if self._timer is not None:
+            self._timer.cancel()
+        self._lock.release()
+
+
+class WorkerPool:
+    """ A resizable pool of threads consuming tasks from a shared queue """
+
+    def __init__(self, min_workers=1, max_workers=1, name='worker'):
+        self._lock = Lock()
+        self.__queue = Queue()
+        self.__intake = Event()
+        self.__intake.set()
+        self.__workers = []
+        self.__retire = 0
+        self.__latencies = []
+        self.__spawned = 0
+        self.name = name
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+
+        self.resize(self.min_workers)
+
+    @property
+    def size(self):
+        with self._lock:
+            return len(self.__workers) - self.__retire
+
+    @property
+    def backlog(self):
+        return self.__queue.qsize()
+
+    @property
+    def paused(self):
+        return not self.__intake.is_set()
+
+    def pause(self):
+        self.__intake.clear()
+
+    def resume(self):
+        self.__intake.set()
+
+    def submit(self, function, *args, block=True, **kwargs):
+        # Blocks the producer (the observer thread) while intake is paused. Tasks queued from inside a
+        # worker must pass block=False, otherwise the worker stalls until intake resumes.
+        if block:
+            self.__intake.wait()
+        self.__queue.put((time.perf_counter(), function, args, kwargs))
+
+    def resize(self, size):
+        size = max(self.min_workers, min(self.max_workers, size))
+        with self._lock:
+            current = len(self.__workers) - self.__retire
+            if size > current:
+                # Cancel pending retirements before spawning new threads.
+                revived = min(self.__retire, size - current)
+                self.__retire -= revived
+                for _ in range(size - current - revived):
+                    self.__spawned += 1
+                    worker = Thread(target=self.__run, name=f'{self.name}-{self.__spawned}', daemon=True)
+                    self.__workers.append(worker)
+                    worker.start()
+            elif size < current:
+                self.__retire += current - size
+        return size
+
+    def oldest_wait_ms(self):
+        """ Age in ms of the task at the head of the queue, 0 when the queue is empty """
+        with self.__queue.mutex:
+            if not self.__queue.queue:
+                return 0.0
+            enqueued = self.__queue.queue[0][0]
+        return (time.perf_counter() - enqueued) * 1000.0
+
+    def pop_latencies(self):
+        """ Return (and reset) the queue wait times in ms observed since the last call """
+        with self._lock:
+            latencies, self.__latencies = self.__latencies, []
+        return latencies
+
+    def __run(self):
+        while True:
+            with self._lock:
+                if self.__retire > 0:
+                    self.__retire -= 1
+                    self.__workers.remove(current_thread())
+                    return
+            try:
+                enqueued, function, args, kwargs = self.__queue.get(timeout=0.25)
+            except Empty:
+                continue
+
+            with self._lock:
+                self.__latencies.append((time.perf_counter() - enqueued) * 1000.0)
+            try:
+                function(*args, **kwargs)
+            except Exception as e:
+                utils.ERROR(f'[{current_thread().name}] Task failed with error: {e}')
+            finally:
+                self.__queue.task_done()
+
+    def stop(self, timeout=None):
+        """
+        Drain the queue and stop all workers. With timeout=None the whole backlog is processed first,
+        otherwise tasks still queued after timeout seconds are dropped and in-flight ones are not waited on.
+        """
+        self.resume()
+        deadline = None if timeout is None else time.perf_counter() + timeout
+
+        with self.__queue.all_tasks_done:
+            while self.__queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.perf_counter()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.__queue.all_tasks_done.wait(remaining)
+
+        dropped = 0
+        while True:
+            try:
+                self.__queue.get_nowait()
+            except Empty:
+                break
+            self.__queue.task_done()
+            dropped += 1
+        if dropped:
+            utils.WARNING(f'Shutdown timeout reached, dropped {dropped} queued tasks.')
+
+        with self._lock:
+            workers = list(self.__workers)
+            self.__retire = len(workers)
+        for worker in workers:
+            worker.join(None if deadline is None else max(0.0, deadline - time.perf_counter()))
+            if worker.is_alive():
+                utils.WARNING(f'[{worker.name}] is still running a task after the shutdown timeout.')
+
+
+class Autoscaler:
+    """
+    Grows or shrinks a WorkerPool within its bounds from live CPU utilisation, available memory and
+    queue latency, and pauses intake while memory headroom is below a threshold.
+    """
+
+    def __init__(self, pool: WorkerPool, interval=5, target_latency_ms=1000, cpu_high_percent=85,
+                 cpu_max_percent=95, min_memory_percent=10, resume_memory_percent=None, metrics_path=None,
+                 auto_start=True, ):
+        self.pool = pool
+        self.target_latency_ms = target_latency_ms
+        self.cpu_high_percent = cpu_high_percent
+        self.cpu_max_percent = cpu_max_percent
+        self.min_memory_percent = min_memory_percent
+        self.resume_memory_percent = resume_memory_percent or min_memory_percent * 1.5
+        self.metrics_path = metrics_path
+        self.metrics = {
+            "workers": pool.size,
+            "grow_total": 0,
+            "shrink_total": 0,
+            "pause_total": 0,
+            "resume_total": 0,
+        }
+
+        # The first non-blocking sample is meaningless, prime it here so the first tick is accurate.
+        psutil.cpu_percent(interval=None)
+        self.__periodic = Periodic(interval, self.tick, autostart=auto_start)
+
+    def tick(self):
+        try:
+            self.__tick()
+        except Exception as e:
+            utils.ERROR(f'Autoscaler tick failed with error: {e}')
+
+    def __tick(self):
+        cpu_percent = psutil.cpu_percent(interval=None)
+        memory = psutil.virtual_memory()
+        memory_percent = memory.available / memory.total * 100.0
+        latencies = self.pool.pop_latencies()
+        # Nothing is dequeued while every worker is stuck on a slow image, so the age of the queue head
+        # is what reveals that case.
+        oldest_wait_ms = self.pool.oldest_wait_ms()
+        latency_ms = max(sum(latencies) / len(latencies) if latencies else 0.0, oldest_wait_ms)
+        backlog = self.pool.backlog
+        workers = self.pool.size
+
+        actions = []
+        if memory_percent < self.min_memory_percent:
+            if not self.pool.paused:
+                self.pool.pause()
+                actions.append('pause')
+            if workers > self.pool.min_workers:
+                workers = self.pool.resize(workers - 1)
+                actions.append('shrink')
+        else:
+            if self.pool.paused and memory_percent >= self.resume_memory_percent:
+                self.pool.resume()
+                actions.append('resume')
+
+            if backlog and latency_ms >= self.target_latency_ms and cpu_percent < self.cpu_high_percent \
+                    and workers < self.pool.max_workers:
+                workers = self.pool.resize(workers + 1)
+                actions.append('grow')
+            elif workers > self.pool.min_workers and (
+                    cpu_percent >= self.cpu_max_percent or
+                    (not backlog and latency_ms < self.target_latency_ms / 2)
+            ):
+                workers = self.pool.resize(workers - 1)
+                actions.append('shrink')
+
+        for action in actions:
+            self.metrics[f'{action}_total'] += 1
+        self.metrics.update({
+            "time": datetime.now().isoformat(),
+            "cpu_percent": cpu_percent,
+            "memory_available_percent": memory_percent,
+            "queue_latency_ms": latency_ms,
+            "oldest_wait_ms": oldest_wait_ms,
+            "backlog": backlog,
+            "workers": workers,
+            "paused": self.pool.paused,
+            "actions": actions,
+        })
+
+        if actions:
+            utils.INFO(f'Autoscaler decision: {self.metrics}')
+        if self.metrics_path:
+            with open(self.metrics_path, 'ta') as file:
+                file.write(json.dumps(self.metrics) + '\n')
+
+    def stop(self):
+        self.__periodic.stop()
+
+
+def create_worker_pool(config: dict, ):
+    pool = WorkerPool(
+        min_workers=config.get('MIN_WORKERS', 1),
+        max_workers=config.get('MAX_WORKERS', os.cpu_count() or 1),
+        name='detector',
+    )
+    autoscaler = Autoscaler(
+        pool,
+        interval=config.get('INTERVAL', 5),
+        target_latency_ms=config.get('TARGET_LATENCY_MS', 1000),
+        cpu_high_percent=config.get('CPU_HIGH_PERCENT', 85),
+        cpu_max_percent=config.get('CPU_MAX_PERCENT', 95),
+        min_memory_percent=config.get('MIN_MEMORY_PERCENT', 10),
+        resume_memory_percent=config.get('RESUME_MEMORY_PERCENT'),
+        metrics_path=config.get('METRICS_PATH'),
+    )
+    return pool, autoscaler